@@ -0,0 +1,509 @@
+#!/usr/bin/env python3
+''' A local stand-in for the parts of github that GiTandMarK uses
+
+It creates synthetic student repositories (bare git repositories used as
+file:// remotes) and serves the API endpoints GiTandMarK calls: the
+organization, the repository listing and search, refs, contents, git data
+(blobs, trees, commits, refs) and GraphQL. Rate limit and ETag headers are
+sent like github does.
+
+    python fake_github.py ROOT --repos 200 --serve
+        create the repositories under ROOT and serve the API until Ctrl-C,
+        then run GiTandMarK with:
+        GITANDMARK_API_URL=http://127.0.0.1:PORT GITANDMARK_GIT_URL=file://ROOT/remotes
+
+    python fake_github.py ROOT --repos 200 --bench
+        time (and check) clone, sync, update, check, add and push against it
+'''
+
+import os
+import re
+import sys
+import json
+import time
+import base64
+import shutil
+import hashlib
+import argparse
+import tempfile
+import threading
+import subprocess
+from urllib.parse import urlparse, parse_qs
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ORG = "SCS-Carleton"
+SUBMIT_FILE = "submit-03"
+RUBRIC_FILE = "rubric-03.md"
+# Commit times of the synthetic submissions: before and after DEADLINE
+DEADLINE = "2017-07-24-23:55"
+ON_TIME = "2017-07-24T16:32:00Z"
+LATE = "2017-07-25T10:00:00Z"
+
+GIT_ENV = dict(os.environ, GIT_AUTHOR_NAME="GiTandMarK", GIT_AUTHOR_EMAIL="bench@localhost",
+               GIT_COMMITTER_NAME="GiTandMarK", GIT_COMMITTER_EMAIL="bench@localhost")
+
+
+def main():
+    ''' The main function to run the script
+    '''
+    args = args_handle()
+    root = os.path.abspath(args.root)
+    make_repos(root, args.prefix, args.repos)
+
+    server = start_server(root, args.port)
+    api_url = "http://127.0.0.1:%d" % server.server_port
+    git_url = "file://%s/remotes" % root
+    if args.bench:
+        bench(api_url, git_url, args.prefix, args.repos, args.jobs)
+        server.shutdown()
+        return
+
+    print("Serving", args.repos, "repositories, use:")
+    print("GITANDMARK_API_URL=%s GITANDMARK_GIT_URL=%s" % (api_url, git_url))
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+def args_handle():
+    ''' Handle input options via command line arguments
+    '''
+    parser = argparse.ArgumentParser(prog='fake_github.py')
+    parser.add_argument("root", help="the directory for the fake repositories")
+    parser.add_argument("-n", "--repos", type=int, default=20,
+                        help="number of student repositories")
+    parser.add_argument("--prefix", default="a3-", help="the repositories name prefix")
+    parser.add_argument("-p", "--port", type=int, default=0, help="the port of the API")
+    parser.add_argument("-j", "--jobs", type=int, default=8,
+                        help="the --jobs given to GiTandMarK (use with --bench)")
+    parser.add_argument("--serve", action="store_true", help="serve until Ctrl-C")
+    parser.add_argument("--bench", action="store_true",
+                        help="time the GiTandMarK commands against the fake")
+    return parser.parse_args()
+
+
+def git(*args, cwd=None, env=None, data=None):
+    ''' Run git, return its output
+    '''
+    return subprocess.run(('git',) + args, cwd=cwd, env=env or GIT_ENV, input=data,
+                          stdout=subprocess.PIPE, check=True).stdout
+
+
+def make_repos(root, prefix, count):
+    ''' Create "count" student repositories (when missing) under root/remotes
+
+    Every repository starts from the same starter commit, like on github
+    classroom; every third student submits late and every tenth leaves the
+    submit file incomplete
+    '''
+    remotes = "%s/remotes/%s" % (root, ORG)
+    os.makedirs(remotes, exist_ok=True)
+    starter = "%s/starter-%s.git" % (remotes, prefix.strip('-'))
+    if not os.path.isdir(starter):
+        work = tempfile.mkdtemp(dir=root)
+        git('init', '-q', work)
+        os.makedirs("%s/src" % work)
+        with open("%s/src/Main.java" % work, 'w') as file:
+            file.write("public class Main {\n    public static void main(String[] args) {}\n}\n")
+        with open("%s/%s" % (work, RUBRIC_FILE), 'w') as file:
+            file.write("# Rubric\n\n" + "".join("- part %d: /10\n" % part for part in range(10)) +
+                       "\n__/100 final grade\n")
+        git('add', '-A', cwd=work)
+        git('commit', '-q', '-m', 'Starter code', cwd=work,
+            env=dict(GIT_ENV, GIT_AUTHOR_DATE="2017-07-01T10:00:00Z",
+                     GIT_COMMITTER_DATE="2017-07-01T10:00:00Z"))
+        git('clone', '-q', '--bare', work, starter)
+
+    for number in range(count):
+        username = "student%03d" % number
+        path = "%s/%s%s.git" % (remotes, prefix, username)
+        if os.path.isdir(path):
+            continue
+        work = tempfile.mkdtemp(dir=root)
+        git('clone', '-q', starter, work)
+        with open("%s/%s" % (work, SUBMIT_FILE), 'w') as file:
+            file.write("%09d\n%s@cmail.carleton.ca\nStudent Number%d\n%s\n" % (
+                100000000 + number, username, number, username if number % 10 else ""))
+        with open("%s/src/Student.java" % work, 'w') as file:
+            file.write("public class Student {\n    // %s\n}\n" % username)
+        # Things students commit that nobody needs for marking
+        os.makedirs("%s/.idea" % work)
+        with open("%s/.idea/workspace.xml" % work, 'w') as file:
+            file.write("<project/>\n" * (number % 50))
+        date = LATE if number % 3 == 2 else ON_TIME
+        git('add', '-A', cwd=work)
+        git('commit', '-q', '-m', 'Submission', cwd=work,
+            env=dict(GIT_ENV, GIT_AUTHOR_DATE=date, GIT_COMMITTER_DATE=date))
+        git('clone', '-q', '--bare', work, path)
+        shutil.rmtree(work)
+
+
+class FakeGithub(BaseHTTPRequestHandler):
+    ''' The request handler of the fake API (root is set by start_server)
+    '''
+    root = None
+    limit = 5000
+    remaining = 5000
+    lock = threading.Lock()
+
+    # pylint: disable=C0103
+    def do_GET(self):
+        ''' Route GET requests
+        '''
+        url = urlparse(self.path)
+        query = {key: values[0] for key, values in parse_qs(url.query).items()}
+        routes = [(r'/orgs/([^/]+)$', self.get_org),
+                  (r'/orgs/([^/]+)/repos$', self.list_repos),
+                  (r'/search/repositories$', self.search_repos),
+                  (r'/repos/([^/]+)/([^/]+)$', self.get_repo),
+                  (r'/repos/([^/]+)/([^/]+)/git/(?:ref|refs)/(.+)$', self.get_ref),
+                  (r'/repos/([^/]+)/([^/]+)/git/commits/(\w+)$', self.get_commit),
+                  (r'/repos/([^/]+)/([^/]+)/contents/(.+)$', self.get_contents)]
+        self.route(routes, url.path, query)
+
+    def do_POST(self):
+        ''' Route POST requests
+        '''
+        body = self.read_body()
+        routes = [(r'/graphql$', self.graphql),
+                  (r'/repos/([^/]+)/([^/]+)/git/blobs$', self.create_blob),
+                  (r'/repos/([^/]+)/([^/]+)/git/trees$', self.create_tree),
+                  (r'/repos/([^/]+)/([^/]+)/git/commits$', self.create_commit),
+                  (r'/repos/([^/]+)/([^/]+)/git/refs$', self.create_ref)]
+        self.route(routes, urlparse(self.path).path, body)
+
+    def do_PATCH(self):
+        ''' Route PATCH requests
+        '''
+        body = self.read_body()
+        routes = [(r'/repos/([^/]+)/([^/]+)/git/refs/(.+)$', self.update_ref)]
+        self.route(routes, urlparse(self.path).path, body)
+
+    def route(self, routes, path, payload):
+        ''' Call the handler of the first matching route
+        '''
+        for pattern, handler in routes:
+            match = re.match(pattern, path)
+            if match:
+                try:
+                    return handler(payload, *match.groups())
+                except subprocess.CalledProcessError:
+                    return self.send(404, {'message': 'Not Found'})
+        return self.send(404, {'message': 'Not Found'})
+
+    def log_message(self, *args):
+        pass
+
+    def read_body(self):
+        ''' Read the json body of the request
+        '''
+        length = int(self.headers.get('Content-Length', 0))
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def send(self, status, obj, links=None):
+        ''' Send a json response with the rate limit headers (and ETag for GET)
+        '''
+        body = json.dumps(obj).encode('utf-8')
+        etag = '"%s"' % hashlib.sha1(body).hexdigest()
+        if self.command == 'GET' and status == 200 and self.headers.get('If-None-Match') == etag:
+            status, body = 304, b""
+        with self.lock:
+            # Like github, a 304 does not count against the rate limit
+            if status != 304:
+                FakeGithub.remaining = max(0, FakeGithub.remaining - 1)
+            remaining = FakeGithub.remaining
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('ETag', etag)
+        self.send_header('X-RateLimit-Limit', str(self.limit))
+        self.send_header('X-RateLimit-Remaining', str(remaining))
+        self.send_header('X-RateLimit-Reset', str(int(time.time()) + 3600))
+        if links:
+            self.send_header('Link', ", ".join('<%s>; rel="%s"' % (url, rel)
+                                               for rel, url in links.items()))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def repo_path(self, owner, name):
+        ''' The path of the bare repository of owner/name
+        '''
+        path = "%s/remotes/%s/%s.git" % (self.root, owner, name)
+        if not os.path.isdir(path):
+            raise subprocess.CalledProcessError(128, 'git')
+        return path
+
+    def repo_object(self, owner, name):
+        ''' The API object of a repository
+        '''
+        path = self.repo_path(owner, name)
+        pushed = os.path.getmtime("%s/refs/heads" % path)
+        return {'name': name, 'full_name': "%s/%s" % (owner, name),
+                'owner': {'login': owner}, 'default_branch': 'master', 'private': True,
+                'size': sum(os.path.getsize(os.path.join(folder, file))
+                            for folder, _, files in os.walk(path) for file in files) // 1024,
+                'pushed_at': time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(pushed)),
+                'url': "%s/repos/%s/%s" % (self.base(), owner, name)}
+
+    def base(self):
+        ''' The base url of the API
+        '''
+        return "http://%s:%d" % self.server.server_address
+
+    def all_repos(self, owner):
+        ''' All the repositories of owner, last pushed first
+        '''
+        repos = [self.repo_object(owner, name[:-4]) for name in
+                 os.listdir("%s/remotes/%s" % (self.root, owner))]
+        return sorted(repos, key=lambda repo: repo['pushed_at'], reverse=True)
+
+    def paginate(self, items, query, wrap=None):
+        ''' Send one page of items with the "next" link
+        '''
+        per_page = int(query.get('per_page', 30))
+        page = int(query.get('page', 1))
+        links = {}
+        if page * per_page < len(items):
+            url = urlparse(self.path)
+            params = "&".join("%s=%s" % (key, value) for key, value in query.items()
+                              if key != 'page')
+            links['next'] = "%s%s?%s&page=%d" % (self.base(), url.path, params, page + 1)
+        chunk = items[(page - 1) * per_page:page * per_page]
+        self.send(200, wrap(chunk) if wrap else chunk, links)
+
+    def get_org(self, query, org):
+        ''' GET /orgs/:org
+        '''
+        self.send(200, {'login': org, 'url': "%s/orgs/%s" % (self.base(), org)})
+
+    def list_repos(self, query, org):
+        ''' GET /orgs/:org/repos
+        '''
+        self.paginate(self.all_repos(org), query)
+
+    def search_repos(self, query):
+        ''' GET /search/repositories (only "TERM in:name org:ORG" queries)
+
+        Like github, the words match whole terms of the names (split on
+        punctuation), not prefixes: "a3-" finds "a3-bob", "a" does not
+        '''
+        terms = query.get('q', "").split()
+        org = next(term[4:] for term in terms if term.startswith('org:'))
+        words = [word for term in terms if ':' not in term
+                 for word in re.findall(r'[A-Za-z0-9]+', term.lower())]
+        repos = [repo for repo in self.all_repos(org)
+                 if set(words) <= set(re.findall(r'[A-Za-z0-9]+', repo['name'].lower()))]
+        self.paginate(repos, query, lambda chunk: {'total_count': len(repos),
+                                                   'incomplete_results': False,
+                                                   'items': chunk})
+
+    def get_repo(self, query, owner, name):
+        ''' GET /repos/:owner/:repo
+        '''
+        self.send(200, self.repo_object(owner, name))
+
+    def get_ref(self, query, owner, name, ref):
+        ''' GET /repos/:owner/:repo/git/ref/:ref
+        '''
+        sha = git('--git-dir', self.repo_path(owner, name), 'rev-parse', '--verify', '-q',
+                  'refs/' + ref).decode().strip()
+        self.send(200, {'ref': 'refs/' + ref, 'object': {'type': 'commit', 'sha': sha}})
+
+    def get_commit(self, query, owner, name, sha):
+        ''' GET /repos/:owner/:repo/git/commits/:sha
+        '''
+        tree = git('--git-dir', self.repo_path(owner, name), 'rev-parse',
+                   sha + '^{tree}').decode().strip()
+        self.send(200, {'sha': sha, 'tree': {'sha': tree}})
+
+    def get_contents(self, query, owner, name, path):
+        ''' GET /repos/:owner/:repo/contents/:path
+        '''
+        ref = query.get('ref', 'HEAD')
+        git_dir = self.repo_path(owner, name)
+        content = git('--git-dir', git_dir, 'show', '%s:%s' % (ref, path))
+        sha = git('--git-dir', git_dir, 'rev-parse', '%s:%s' % (ref, path)).decode().strip()
+        self.send(200, {'type': 'file', 'encoding': 'base64', 'name': path.split('/')[-1],
+                        'path': path, 'sha': sha, 'size': len(content),
+                        'content': base64.b64encode(content).decode()})
+
+    def graphql(self, body):
+        ''' POST /graphql (only "alias: repository(owner:, name:)" HEAD queries)
+        '''
+        data = {}
+        for alias, owner, name in re.findall(
+                r'(\w+): repository\(owner: "([^"]+)", name: "([^"]+)"\)', body['query']):
+            try:
+                line = git('--git-dir', self.repo_path(owner, name), 'log', '-1',
+                           '--format=%H %ct', 'HEAD').decode().split()
+                date = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(int(line[1])))
+                data[alias] = {'defaultBranchRef': {'target': {'oid': line[0],
+                                                               'committedDate': date}}}
+            except subprocess.CalledProcessError:
+                data[alias] = None
+        self.send(200, {'data': data})
+
+    def create_blob(self, body, owner, name):
+        ''' POST /repos/:owner/:repo/git/blobs
+        '''
+        content = base64.b64decode(body['content']) if body.get('encoding') == 'base64' \
+            else body['content'].encode('utf-8')
+        sha = git('--git-dir', self.repo_path(owner, name), 'hash-object', '-w', '--stdin',
+                  data=content).decode().strip()
+        self.send(201, {'sha': sha})
+
+    def create_tree(self, body, owner, name):
+        ''' POST /repos/:owner/:repo/git/trees (entries with a sha or a content)
+        '''
+        git_dir = self.repo_path(owner, name)
+        env = dict(GIT_ENV, GIT_INDEX_FILE="%s/fake-index-%d" % (git_dir, threading.get_ident()))
+        if body.get('base_tree'):
+            git('--git-dir', git_dir, 'read-tree', body['base_tree'], env=env)
+        else:
+            git('--git-dir', git_dir, 'read-tree', '--empty', env=env)
+        for entry in body['tree']:
+            sha = entry.get('sha') or git('--git-dir', git_dir, 'hash-object', '-w', '--stdin',
+                                          data=entry['content'].encode('utf-8')).decode().strip()
+            git('--git-dir', git_dir, 'update-index', '--add', '--cacheinfo',
+                '%s,%s,%s' % (entry['mode'], sha, entry['path']), env=env)
+        sha = git('--git-dir', git_dir, 'write-tree', env=env).decode().strip()
+        os.remove(env['GIT_INDEX_FILE'])
+        self.send(201, {'sha': sha})
+
+    def create_commit(self, body, owner, name):
+        ''' POST /repos/:owner/:repo/git/commits
+        '''
+        parents = []
+        for parent in body.get('parents', []):
+            parents += ['-p', parent]
+        sha = git('--git-dir', self.repo_path(owner, name), 'commit-tree', body['tree'],
+                  *parents, data=body['message'].encode('utf-8')).decode().strip()
+        self.send(201, {'sha': sha, 'tree': {'sha': body['tree']}})
+
+    def create_ref(self, body, owner, name):
+        ''' POST /repos/:owner/:repo/git/refs
+        '''
+        git_dir = self.repo_path(owner, name)
+        try:
+            git('--git-dir', git_dir, 'rev-parse', '--verify', '-q', body['ref'])
+            return self.send(422, {'message': 'Reference already exists'})
+        except subprocess.CalledProcessError:
+            pass
+        git('--git-dir', git_dir, 'update-ref', body['ref'], body['sha'])
+        self.send(201, {'ref': body['ref'], 'object': {'type': 'commit', 'sha': body['sha']}})
+
+    def update_ref(self, body, owner, name, ref):
+        ''' PATCH /repos/:owner/:repo/git/refs/:ref
+        '''
+        git_dir = self.repo_path(owner, name)
+        old = git('--git-dir', git_dir, 'rev-parse', 'refs/' + ref).decode().strip()
+        ancestor = subprocess.run(['git', '--git-dir', git_dir, 'merge-base', '--is-ancestor',
+                                   old, body['sha']]).returncode == 0
+        if not ancestor and not body.get('force'):
+            return self.send(422, {'message': 'Update is not a fast forward'})
+        git('--git-dir', git_dir, 'update-ref', 'refs/' + ref, body['sha'])
+        self.send(200, {'ref': 'refs/' + ref, 'object': {'type': 'commit', 'sha': body['sha']}})
+
+
+def start_server(root, port=0):
+    ''' Serve the fake API in a background thread
+    '''
+    FakeGithub.root = root
+    server = ThreadingHTTPServer(('127.0.0.1', port), FakeGithub)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def bench(api_url, git_url, prefix, count, jobs):
+    ''' Run the GiTandMarK commands against the fake in a new workspace and
+        print how long every command took
+    '''
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'GiTandMarK')
+    workspace = tempfile.mkdtemp(prefix='gitandmark-bench-')
+    env = dict(GIT_ENV, GITANDMARK_API_URL=api_url, GITANDMARK_GIT_URL=git_url)
+    os.makedirs("%s/data" % workspace)
+    with open("%s/data/data.json" % workspace, 'w') as file:
+        json.dump({'user': None, 'token': 'fake', 'dir': './', 'deadline':
+                   time.mktime(time.strptime(DEADLINE, "%Y-%m-%d-%H:%M")), 'bonus': None,
+                   'commits': 0, 'submit_file': [SUBMIT_FILE], 'rubric_file': RUBRIC_FILE,
+                   'done': False}, file)
+    with open("%s/Tester.java" % workspace, 'w') as file:
+        file.write("public class Tester {}\n")
+    submissions = "%s/submissions" % workspace
+
+    def run(name, *args, stdin=None, check=None):
+        start = time.time()
+        completed = subprocess.run([sys.executable, script] + list(args), cwd=workspace,
+                                   env=env, input=stdin, universal_newlines=True,
+                                   stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+        elapsed = time.time() - start
+        status = "ok"
+        if completed.returncode:
+            status = "FAILED"
+        elif check and not check():
+            status = "WRONG RESULT"
+        if status != "ok":
+            print(completed.stdout)
+        print("%-8s %8.2fs  %s" % (name, elapsed, status))
+
+    def info():
+        with open("%s/info.json" % submissions, 'r') as file:
+            return json.load(file)
+
+    def added():
+        # Every clone has the file and its commit is on github
+        for name in os.listdir(submissions):
+            path = "%s/%s" % (submissions, name)
+            if os.path.isdir(path):
+                head = git('rev-parse', 'HEAD', cwd=path).decode().strip()
+                if git('ls-remote', 'origin', 'HEAD', cwd=path).decode().split()[0] != head:
+                    return False
+                git('cat-file', '-e', 'HEAD:Tester.java', cwd=path)
+        return True
+
+    def mark(old="PUT MARK HERE", new="75.0"):
+        # What the markers do: put a mark in every rubric
+        for name in os.listdir(submissions):
+            path = "%s/%s/%s" % (submissions, name, RUBRIC_FILE)
+            if os.path.isfile(path):
+                with open(path, 'r') as file:
+                    text = file.read()
+                with open(path, 'w') as file:
+                    file.write(text.replace(old, new))
+
+    def pushed_ahead():
+        # The API commit goes on top of the "graded" branch the clones pushed
+        for name in os.listdir(submissions):
+            path = "%s/%s" % (submissions, name)
+            if os.path.isdir(path):
+                local = git('rev-parse', 'graded', cwd=path).decode().strip()
+                remote = git('ls-remote', 'origin', 'refs/heads/graded', cwd=path).decode()
+                if not remote or remote.split()[0] == local:
+                    return False
+                git('fetch', '-q', 'origin', 'graded', cwd=path)
+                if git('rev-parse', 'FETCH_HEAD^', cwd=path).decode().strip() != local:
+                    return False
+        return True
+
+    print("Benchmark of", count, "repositories in", workspace)
+    run("clone", 'git', '-c', prefix, '-j', str(jobs),
+        check=lambda: info()['total'] == count and not info()['unknowns'])
+    run("sync", 'git', '-c', prefix, '-j', str(jobs), '-s', submissions,
+        check=lambda: info()['total'] == count)
+    run("update", 'submit', '-U', submissions, stdin="0.5\n",
+        check=lambda: sum(1 for student in info()['students'].values()
+                          if student['status'].startswith('LATE')) == len(
+                              [number for number in range(count) if number % 3 == 2]))
+    run("update-R", 'submit', '-U', submissions, '-R', stdin="0.5\n")
+    run("add", 'git', '-a', prefix, 'Tester.java', '-j', str(jobs), check=added)
+    mark()
+    run("check", 'submit', '-ck', submissions, check=lambda: info()['done'])
+    run("push", 'submit', '-p', submissions, '-j', str(jobs))
+    mark("75.0", "80.0")
+    run("push-A", 'submit', '-p', submissions, '-A', '-j', str(jobs), check=pushed_ahead)
+
+
+if __name__ == "__main__":
+    main()